@@ -4,82 +4,444 @@ Backup Synchronization Script with Telegram Notifications
 Syncs backup data from server A to server B using rsync over SSH
 """
 
+import atexit
+import collections
+import functools
+import hashlib
+import heapq
 import os
+import pickle
+import queue
+import re
 import sys
+import shlex
+import shutil
+import stat
 import subprocess
+import tempfile
+import threading
+import time
 import logging
+import logging.handlers
 import json
-import requests
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timedelta
-from typing import Dict, Optional
-import argparse
-
-# Setup logging
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Setup logging; records are written by a listener thread so sync threads
+# never block on the log file or the terminal
+_log_handlers = [
+    logging.FileHandler('./backup_sync.log'),
+    logging.StreamHandler()
+]
+for _handler in _log_handlers:
+    _handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+_log_queue = queue.Queue(-1)
+_log_listener = logging.handlers.QueueListener(_log_queue, *_log_handlers)
+_log_listener.start()
+# Drains the queue on exit, including sys.exit() from configuration errors
+atexit.register(_log_listener.stop)
 logging.basicConfig(
     level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('./backup_sync.log'),
-        logging.StreamHandler()
-    ]
+    format='%(message)s',  # the listener's handlers add the real format
+    handlers=[logging.handlers.QueueHandler(_log_queue)]
 )
 logger = logging.getLogger(__name__)
 
+@functools.lru_cache(maxsize=None)
+def _json_loads() -> Callable:
+    """Return orjson.loads when installed, else json.loads; both accept bytes"""
+    # Imported on first use: a cached configuration never needs a parser.
+    # orjson.JSONDecodeError subclasses json.JSONDecodeError
+    try:
+        from orjson import loads
+    except ImportError:
+        loads = json.loads
+    return loads
+
+@functools.lru_cache(maxsize=None)
+def _local_rsync_version() -> tuple:
+    """Return the local rsync version as a (major, minor) tuple, (0, 0) if unknown"""
+    try:
+        output = subprocess.run(
+            ['rsync', '--version'], capture_output=True, text=True, timeout=10
+        ).stdout
+    except Exception as e:
+        logger.warning(f"Failed to detect rsync version: {e}")
+        return (0, 0)
+
+    match = re.search(r'version (\d+)\.(\d+)', output)
+    return (int(match.group(1)), int(match.group(2))) if match else (0, 0)
+
+@functools.lru_cache(maxsize=None)
+def _which(program: str) -> str:
+    """Resolve a program to an absolute path, or return it unchanged"""
+    return shutil.which(program) or program
+
+def _copy_file(src: str, dst: str):
+    """Copy file contents in the kernel with copy_file_range, else shutil"""
+    copy_file_range = getattr(os, 'copy_file_range', None)  # Linux, Python 3.8+
+    if copy_file_range:
+        try:
+            with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+                while copy_file_range(fsrc.fileno(), fdst.fileno(), 1 << 30):
+                    pass
+            return
+        except OSError:
+            # e.g. unsupported across these filesystems; copy in user space
+            pass
+    shutil.copyfile(src, dst)
+
+def _rsync_pattern_regex(pattern: str) -> str:
+    """Translate an rsync wildcard pattern into a regular expression"""
+    # Unlike fnmatch, * and ? stop at '/', while ** crosses it
+    parts = []
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        if pattern.startswith('**', i):
+            parts.append('.*')
+            while i < len(pattern) and pattern[i] == '*':
+                i += 1
+            continue
+        if char == '*':
+            parts.append('[^/]*')
+        elif char == '?':
+            parts.append('[^/]')
+        elif char == '\\' and i + 1 < len(pattern):
+            i += 1
+            parts.append(re.escape(pattern[i]))
+        elif char == '[':
+            end = i + 1
+            if end < len(pattern) and pattern[end] in '!^':
+                end += 1
+            if end < len(pattern) and pattern[end] == ']':
+                end += 1
+            end = pattern.find(']', end)
+            if end == -1:
+                parts.append(re.escape(char))
+            else:
+                body = pattern[i + 1:end].replace('\\', '\\\\').replace('[', '\\[')
+                parts.append('[' + ('^' + body[1:] if body[0] in '!^' else body) + ']')
+                i = end
+        else:
+            parts.append(re.escape(char))
+        i += 1
+    return ''.join(parts)
+
+def _exclude_matcher(patterns: List[str]) -> Callable[[str, bool], bool]:
+    """Return a predicate applying rsync --exclude rules to a relative path"""
+    rules = []
+    for pattern in patterns:
+        # A trailing slash only matches directories
+        dir_only = pattern.endswith('/') and not pattern.endswith('/***')
+        pattern = pattern.rstrip('/') if dir_only else pattern
+        # dir/*** matches the directory itself and everything below it
+        suffix = ''
+        if pattern.endswith('/***'):
+            pattern, suffix = pattern[:-4], '(?:/.*)?'
+        # A leading slash anchors at the top of the transfer; otherwise the
+        # pattern may match the trailing components at any depth
+        if pattern.startswith('/'):
+            regex = _rsync_pattern_regex(pattern[1:]) + suffix
+        else:
+            regex = '(?:.*/)?' + _rsync_pattern_regex(pattern) + suffix
+        rules.append((re.compile(regex, re.DOTALL), dir_only))
+
+    def excluded(rel_path: str, is_dir: bool) -> bool:
+        return any((is_dir or not dir_only) and regex.fullmatch(rel_path)
+                   for regex, dir_only in rules)
+
+    return excluded
+
 class TelegramNotifier:
     """Handle Telegram notifications"""
 
+    # Telegram rejects sendMessage text longer than this
+    MAX_MESSAGE_LENGTH = 4096
+
     def __init__(self, bot_token: str, chat_id: str):
         self.bot_token = bot_token
         self.chat_id = chat_id
         self.api_url = f"https://api.telegram.org/bot{bot_token}/sendMessage"
-
-    def send_message(self, message: str, parse_mode: str = "HTML") -> bool:
-        """Send message to Telegram chat"""
+        self.edit_url = f"https://api.telegram.org/bot{bot_token}/editMessageText"
+        # Created by the first request, see _get_session()
+        self._session = None
+        # Fields shared by every sendMessage and editMessageText request
+        self._payload = {'chat_id': chat_id}
+        # Message fragments waiting for flush()
+        self._queue = []
+
+    def _get_session(self):
+        """Return the HTTP session, importing requests and creating it on first use"""
+        if self._session is None:
+            # Deferred so the import happens on the notification worker while
+            # rsync starts, and --help or configuration errors never pay for it
+            import requests
+            from requests.adapters import HTTPAdapter
+            from urllib3.util.retry import Retry
+
+            # Keep-alive session so consecutive messages reuse one TLS connection
+            session = requests.Session()
+            session.headers.update({'Content-Type': 'application/json'})
+            # Retry rate limits and transient server errors with backoff
+            retry_options = dict(total=3, backoff_factor=0.3,
+                                 status_forcelist=(429, 500, 502, 503, 504))
+            try:
+                retry = Retry(allowed_methods=frozenset({'POST'}), **retry_options)
+            except TypeError:
+                # urllib3 < 1.26, which requests 2.25 still allows, only
+                # knows the older name
+                retry = Retry(method_whitelist=frozenset({'POST'}), **retry_options)
+            session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=2,
+                                                  max_retries=retry))
+            self._session = session
+        return self._session
+
+    def _post(self, url: str, message: str, parse_mode: str, **fields) -> int:
+        """Post message text to a Bot API method and return the message_id"""
+        if len(message) > self.MAX_MESSAGE_LENGTH:
+            # Telegram rejects the whole message otherwise; cut at a line
+            # break since every HTML tag we send opens and closes on one line
+            limit = self.MAX_MESSAGE_LENGTH - len("\n…")
+            cut = message.rfind('\n', 0, limit)
+            message = message[:cut if cut > 0 else limit] + "\n…"
+        # File names that weren't valid UTF-8 arrive as surrogates, which
+        # Telegram rejects; show them as replacement characters instead
+        message = message.encode('utf-8', 'replace').decode('utf-8')
+        payload = {**self._payload, **fields, 'text': message, 'parse_mode': parse_mode}
+        response = self._get_session().post(url, json=payload, timeout=30)
+        response.raise_for_status()
+        return response.json()['result']['message_id']
+
+    def send_message(self, message: str, parse_mode: str = "HTML") -> Optional[int]:
+        """Send message to Telegram chat, returning its message_id or None on failure"""
         try:
-            payload = {
-                'chat_id': self.chat_id,
-                'text': message,
-                'parse_mode': parse_mode
-            }
-            response = requests.post(self.api_url, json=payload, timeout=30)
-            response.raise_for_status()
+            message_id = self._post(self.api_url, message, parse_mode)
             logger.info("Telegram notification sent successfully")
-            return True
+            return message_id
         except Exception as e:
             logger.error(f"Failed to send Telegram notification: {e}")
+            return None
+
+    def edit_message(self, message_id: Optional[int], message: str, parse_mode: str = "HTML") -> Optional[int]:
+        """Replace the text of a sent message, sending a new one if that fails"""
+        if message_id is not None:
+            try:
+                self._post(self.edit_url, message, parse_mode, message_id=message_id)
+                logger.info("Telegram notification updated successfully")
+                return message_id
+            except Exception as e:
+                logger.warning(f"Failed to update Telegram notification, sending a new one: {e}")
+        return self.send_message(message, parse_mode)
+
+    def queue(self, message: str):
+        """Queue message text to be sent by the next flush()"""
+        self._queue.append(message)
+
+    def flush(self, message_id: Optional[int] = None) -> bool:
+        """Send queued text in as few messages as possible, reusing message_id for the first"""
+        # Pack queued fragments into messages up to Telegram's length limit,
+        # splitting only between fragments so HTML tags stay balanced
+        batches = []
+        current = []
+        current_length = 0
+        for fragment in self._queue:
+            if current and current_length + len(fragment) > self.MAX_MESSAGE_LENGTH:
+                batches.append(''.join(current))
+                current = []
+                current_length = 0
+            current.append(fragment)
+            current_length += len(fragment)
+        if current:
+            batches.append(''.join(current))
+        self._queue = []
+
+        success = True
+        for index, batch in enumerate(batches):
+            if index == 0 and message_id is not None:
+                sent = self.edit_message(message_id, batch)
+            else:
+                sent = self.send_message(batch)
+            success = sent is not None and success
+        return success
+
+    def close(self):
+        """Close the underlying HTTP session"""
+        if self._session is not None:
+            self._session.close()
+
+class _StreamingStatsParser:
+    """Incrementally parse rsync --stats and --itemize-changes output"""
+
+    # Number of sample filenames kept per operation for notifications
+    MAX_SAMPLES = 10
+
+    # Strings that look like rsync progress or status output rather than a
+    # filename, matched in a single pass against the lowercased name (a
+    # case-sensitive search is several times faster than re.IGNORECASE)
+    _INVALID_FILENAME_RE = re.compile('|'.join(re.escape(pattern.lower()) for pattern in [
+        'kB/s', 'MB/s', 'GB/s', '%', 'xfr#', 'ir-chk', 'to-chk',
+        'receiving file list', 'building file list', 'speedup is',
+        'delta-transmission', 'total size is', 'sent ', 'received ',
+        '(DRY RUN)', 'cannot stat', 'failed to', 'error'
+    ]))
+
+    # First characters of --itemize-changes rows (and "*deleting")
+    _ITEMIZE_FLAGS = frozenset('><*.')
+
+    # rsync --stats lines: prefix, stats key and whether the value is numeric
+    _STAT_PREFIXES = (
+        ('Number of files:', 'total_files', False),
+        ('Number of regular files transferred:', 'files_transferred', False),
+        ('Total file size:', 'total_size', True),
+        ('Total bytes sent:', 'bytes_sent', True),
+    )
+    _STAT_FIRST_CHARS = frozenset(prefix[0] for prefix, _, _ in _STAT_PREFIXES)
+
+    # Digits mixed only with spaces, dots and colons (sizes, timestamps)
+    _NUMERIC_RE = re.compile(r'[ .:]*\d[\d .:]*$')
+
+    # File operations tracked in the summary
+    OPERATIONS = ('added', 'updated', 'deleted')
+
+    def __init__(self):
+        self.stats = {}
+        self.counts = {operation: 0 for operation in self.OPERATIONS}
+        self.samples = {operation: [] for operation in self.OPERATIONS}
+
+    @staticmethod
+    def _is_valid_filename(filename: str) -> bool:
+        """Check if a string looks like a valid filename"""
+        if not filename or len(filename) > 1000:  # Sanity check for length
+            return False
+
+        # Skip strings that look like rsync progress or status output
+        if _StreamingStatsParser._INVALID_FILENAME_RE.search(filename.lower()):
+            return False
+
+        # Skip if it's just numbers or looks like progress output
+        if _StreamingStatsParser._NUMERIC_RE.match(filename):
             return False
 
+        return True
+
+    def record(self, operation: str, filename: str):
+        """Count a file operation, keeping the first few names as samples"""
+        self.counts[operation] += 1
+        samples = self.samples[operation]
+        if len(samples) < self.MAX_SAMPLES:
+            samples.append(filename)
+
+    def _add_deleted(self, deleted_file: str):
+        if deleted_file and not deleted_file.endswith('/') and self._is_valid_filename(deleted_file):
+            self.record('deleted', deleted_file)
+
+    def feed(self, line: str):
+        """Consume a single line of rsync output"""
+        first = line[:1]
+
+        # Parse file operations (from --itemize-changes output)
+        if first in self._ITEMIZE_FLAGS:
+            if line.startswith('*deleting'):
+                self._add_deleted(line[10:].strip())  # Remove "*deleting " prefix
+            elif line[1:2] == 'f' and len(line) > 11:
+                # Parse --itemize-changes output format: YXcstpoguax filename
+                # (only regular files, X == 'f', are reported)
+                changes = line[2:11]   # 9 character change summary
+                filename = line[11:].strip()
+
+                if filename and self._is_valid_filename(filename):
+                    if '+++++++' in changes:
+                        # New file (++++++++ means new)
+                        self.record('added', filename)
+                    elif '.' in changes and changes != '.........':
+                        # Updated file (. means unchanged, other chars mean changes)
+                        self.record('updated', filename)
+            return
+
+        if first == 'd':
+            if line.startswith('deleting '):
+                self._add_deleted(line[9:].strip())  # Remove "deleting " prefix
+            return
+
+        # Parse statistics; anything else (progress, file list headers,
+        # summary lines) falls through without matching a prefix
+        if first in self._STAT_FIRST_CHARS:
+            for prefix, key, numeric in self._STAT_PREFIXES:
+                if line.startswith(prefix):
+                    value = line[len(prefix):].strip()
+                    if numeric:
+                        try:
+                            value = int(value.split()[0].replace(',', ''))
+                        except (IndexError, ValueError):
+                            value = 0
+                    self.stats[key] = value
+                    break
+
+    def result(self) -> Dict:
+        """Return parsed statistics together with file operation summaries"""
+        stats = dict(self.stats)
+        for operation in self.OPERATIONS:
+            stats[f'{operation}_files'] = list(self.samples[operation])
+            stats[f'{operation}_count'] = self.counts[operation]
+        return stats
+
+def _merge_stats(shard_stats: List[Dict], final_stats: Optional[Dict] = None) -> Dict:
+    """Combine parsed stats from parallel rsync shards and an optional final pass"""
+    all_stats = shard_stats + ([final_stats] if final_stats else [])
+    # The final pass sees the whole tree, so its totals win when present
+    merged = dict(final_stats) if final_stats else {}
+
+    transferred = 0
+    for stats in all_stats:
+        try:
+            transferred += int(str(stats.get('files_transferred', 0)).replace(',', ''))
+        except ValueError:
+            pass
+    merged['files_transferred'] = f"{transferred:,}"
+    merged['bytes_sent'] = sum(stats.get('bytes_sent', 0) for stats in all_stats)
+
+    for operation in _StreamingStatsParser.OPERATIONS:
+        samples = []
+        for stats in all_stats:
+            samples.extend(stats.get(f'{operation}_files', []))
+        merged[f'{operation}_files'] = samples[:_StreamingStatsParser.MAX_SAMPLES]
+        merged[f'{operation}_count'] = sum(stats.get(f'{operation}_count', 0) for stats in all_stats)
+
+    return merged
+
 class BackupSyncer:
     """Main backup synchronization class"""
 
+    # Accepted 'compress' values; auto lets rsync negotiate via -z
+    COMPRESS_CHOICES = ('auto', 'zstd', 'zlib', 'none')
+
     def __init__(self, config_path: str = "config.json"):
         self.config = self.load_config(config_path)
         self.telegram = TelegramNotifier(
             self.config['telegram']['bot_token'],
             self.config['telegram']['chat_id']
         )
+        # Directory holding the SSH ControlMaster socket while sync() runs
+        self._ssh_control_dir = None
+        # Single worker so notifications go out in order without making
+        # the syncs wait on api.telegram.org
+        self._notifications = ThreadPoolExecutor(max_workers=1)
 
     def load_config(self, config_path: str) -> Dict:
         """Load configuration from JSON file"""
         try:
-            with open(config_path, 'r') as f:
-                config = json.load(f)
+            st = os.stat(config_path)
+            config = self._load_cached_config(config_path, st)
+            if config is not None:
+                return config
 
-            # Validate required configuration keys
-            required_keys = [
-                'source_server', 'ssh_key_path', 'telegram', 'directories'
-            ]
-
-            for key in required_keys:
-                if key not in config:
-                    raise ValueError(f"Missing required configuration key: {key}")
-
-            if 'bot_token' not in config['telegram'] or 'chat_id' not in config['telegram']:
-                raise ValueError("Missing Telegram bot_token or chat_id in configuration")
-
-            if not isinstance(config['directories'], list) or len(config['directories']) == 0:
-                raise ValueError("'directories' must be a non-empty list")
+            with open(config_path, 'rb') as f:
+                config = _json_loads()(f.read())
 
+            self._validate_config(config)
+            self._save_cached_config(config_path, st, config)
             return config
 
         except FileNotFoundError:
@@ -92,91 +454,722 @@ class BackupSyncer:
             logger.error(f"Error loading configuration: {e}")
             sys.exit(1)
 
+    def _validate_config(self, config: Dict):
+        """Raise ValueError if the configuration is incomplete or invalid"""
+        # Validate required configuration keys
+        required_keys = [
+            'source_server', 'ssh_key_path', 'telegram', 'directories'
+        ]
+
+        for key in required_keys:
+            if key not in config:
+                raise ValueError(f"Missing required configuration key: {key}")
+
+        if 'bot_token' not in config['telegram'] or 'chat_id' not in config['telegram']:
+            raise ValueError("Missing Telegram bot_token or chat_id in configuration")
+
+        if not isinstance(config['directories'], list) or len(config['directories']) == 0:
+            raise ValueError("'directories' must be a non-empty list")
+
+        if config.get('compress', 'auto') not in self.COMPRESS_CHOICES:
+            raise ValueError("'compress' must be one of: auto, zstd, zlib, none")
+
+        for directory in config['directories']:
+            if directory.get('mode', 'rsync') not in ('rsync', 'tar-stream'):
+                raise ValueError(f"'mode' for {directory.get('name')} must be 'rsync' or 'tar-stream'")
+            streams = directory.get('parallel_streams', 1)
+            if not isinstance(streams, int) or streams < 1:
+                raise ValueError(f"'parallel_streams' for {directory.get('name')} must be a positive integer")
+            if directory.get('compress', 'auto') not in self.COMPRESS_CHOICES:
+                raise ValueError(f"'compress' for {directory.get('name')} must be one of: auto, zstd, zlib, none")
+            extra = directory.get('rsync_extra', [])
+            if not isinstance(extra, list) or not all(isinstance(arg, str) for arg in extra):
+                raise ValueError(f"'rsync_extra' for {directory.get('name')} must be a list of strings")
+
+        if 'max_parallel' in config:
+            if not isinstance(config['max_parallel'], int) or config['max_parallel'] < 1:
+                raise ValueError("'max_parallel' must be a positive integer")
+
+    def _load_cached_config(self, config_path: str, st: os.stat_result) -> Optional[Dict]:
+        """Return the validated configuration cached for this version of the file"""
+        try:
+            with open(f"{config_path}.cache", 'rb') as f:
+                mtime_ns, size, config = pickle.load(f)
+        except Exception:
+            # Missing, stale format or corrupt cache: parse the JSON instead
+            return None
+        if (mtime_ns, size) != (st.st_mtime_ns, st.st_size):
+            return None
+        return config
+
+    def _save_cached_config(self, config_path: str, st: os.stat_result, config: Dict):
+        """Cache the validated configuration next to the JSON file"""
+        cache_path = f"{config_path}.cache"
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        try:
+            # The cache holds the bot token, so keep it private like config.json
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump((st.st_mtime_ns, st.st_size, config), f)
+            os.replace(tmp_path, cache_path)
+        except OSError as e:
+            logger.debug(f"Could not write configuration cache {cache_path}: {e}")
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+
+    SIZE_UNITS = ('B', 'KB', 'MB', 'GB', 'TB', 'PB')
+
+    # Lines of rsync stderr kept for logs and notifications
+    STDERR_TAIL_LINES = 50
+
     def format_size(self, size_bytes: int) -> str:
         """Format bytes to human readable format"""
-        for unit in ['B', 'KB', 'MB', 'GB', 'TB']:
-            if size_bytes < 1024.0:
-                return f"{size_bytes:.2f} {unit}"
-            size_bytes /= 1024.0
-        return f"{size_bytes:.2f} PB"
-
-    def _is_valid_filename(self, filename: str) -> bool:
-        """Check if a string looks like a valid filename"""
-        if not filename or len(filename) > 1000:  # Sanity check for length
-            return False
+        # Each unit is 10 more bits, so the unit follows from the bit length
+        index = min((max(int(size_bytes), 1).bit_length() - 1) // 10, len(self.SIZE_UNITS) - 1)
+        return f"{size_bytes / (1 << (index * 10)):.2f} {self.SIZE_UNITS[index]}"
+
+    def _ssh_options(self) -> List[str]:
+        """Return ssh options shared by every connection to the source server"""
+        options = ['-i', self.config['ssh_key_path'], '-o', 'StrictHostKeyChecking=no']
+        if self._ssh_control_dir:
+            # Reuse one multiplexed connection instead of a handshake per rsync
+            options.extend([
+                '-o', 'ControlMaster=auto',
+                # %C is a fixed 40-character hash of the connection, keeping
+                # the path (plus ssh's bind suffix) under the 104-byte socket limit
+                '-o', f"ControlPath={os.path.join(self._ssh_control_dir, '%C')}",
+                '-o', 'ControlPersist=600s'
+            ])
+        return options
+
+    def _open_ssh_master(self):
+        """Start a background SSH master connection to the source server"""
+        if not self.config.get('ssh_multiplexing', True):
+            return
+        if all(self._is_local(directory) for directory in self.config['directories']):
+            return
 
-        # Skip strings that look like rsync progress or status output
-        invalid_patterns = [
-            'kB/s', 'MB/s', 'GB/s', '%', 'xfr#', 'ir-chk', 'to-chk',
-            'receiving file list', 'building file list', 'speedup is',
-            'delta-transmission', 'total size is', 'sent ', 'received ',
-            '(DRY RUN)', 'cannot stat', 'failed to', 'error'
-        ]
+        # mkdtemp creates the directory with 0700 so the socket is private.
+        # /tmp rather than $TMPDIR, which is around 49 characters on macOS
+        self._ssh_control_dir = tempfile.mkdtemp(prefix='bsync-', dir='/tmp' if os.path.isdir('/tmp') else None)
+        try:
+            subprocess.run(
+                ['ssh', '-MNf'] + self._ssh_options() + [self.config['source_server']],
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                timeout=60,
+                check=True
+            )
+            logger.info(f"Opened SSH master connection to {self.config['source_server']}")
+        except Exception as e:
+            # rsync still works without a pre-opened master; ControlMaster=auto
+            # lets the first connection become the master instead
+            logger.warning(f"Failed to open SSH master connection: {e}")
 
-        filename_lower = filename.lower()
-        for pattern in invalid_patterns:
-            if pattern in filename_lower:
-                return False
+    def _close_ssh_master(self):
+        """Stop the SSH master connection and remove its socket directory"""
+        if not self._ssh_control_dir:
+            return
 
-        # Skip if it's just numbers or looks like progress output
-        if filename.replace(' ', '').replace('.', '').replace(':', '').isdigit():
-            return False
+        try:
+            subprocess.run(
+                ['ssh', '-O', 'exit'] + self._ssh_options() + [self.config['source_server']],
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                timeout=30
+            )
+        except Exception as e:
+            logger.warning(f"Failed to close SSH master connection: {e}")
+        finally:
+            shutil.rmtree(self._ssh_control_dir, ignore_errors=True)
+            self._ssh_control_dir = None
+
+    def _compression(self, directory_config: Dict) -> str:
+        """Return the compression algorithm for a directory"""
+        # Per-directory setting wins, e.g. 'none' for sources on a fast LAN
+        return directory_config.get('compress', self.config.get('compress', 'auto'))
+
+    def _compression_flags(self, directory_config: Dict) -> List[str]:
+        """Return rsync compression flags for the configured algorithm"""
+        compress = self._compression(directory_config)
+        if compress == 'none':
+            return []
+        if compress == 'auto':
+            # rsync 3.2+ on both ends negotiates zstd for -z; older ones use zlib
+            return ['-z']
+        # An explicit choice needs rsync 3.2+ on both ends; only the local
+        # side can be checked here
+        if _local_rsync_version() >= (3, 2):
+            return [f'--compress-choice={compress}']
+        logger.warning(f"rsync < 3.2 has no --compress-choice, using -z instead of {compress}")
+        return ['-z']
+
+    def _archive_flags(self, directory_config: Dict) -> List[str]:
+        """Return the rsync flags selecting which file attributes are kept"""
+        if directory_config.get('preserve_attributes', True):
+            return ['-a']  # archive
+        # Fast mode: skip owner, group and permission checks and updates
+        return ['-rltD', '--no-owner', '--no-group', '--no-perms']
+
+    def _transfer_options(self, directory_config: Dict, delete: bool = True) -> List[str]:
+        """Return rsync options for a transfer run of a directory"""
+        options = [
+            *self._archive_flags(directory_config),
+            *self._compression_flags(directory_config),
+            '--stats',
+            '--itemize-changes',  # show detailed changes for each file
+        ]
+        if delete:
+            options.append('--delete')  # delete files that don't exist in source
 
-        # Skip if it contains parentheses with transfer info
-        if '(' in filename and any(x in filename for x in ['xfr#', 'ir-chk', 'to-chk']):
-            return False
+        # Copy whole files instead of computing deltas (fresh destinations)
+        if directory_config.get('whole_file', False):
+            options.append('-W')
 
-        return True
+        # Anything else the user wants passed through, e.g. --inplace
+        options.extend(directory_config.get('rsync_extra', []))
 
-    def run_rsync(self, directory_config: Dict) -> Dict:
-        """Execute rsync command for a specific directory and return results"""
-        start_time = datetime.now()
+        return options
 
+    def _rsync_cmd(self, directory_config: Dict, options: List[str]) -> List[str]:
+        """Build an rsync command pulling a directory with the given options"""
         # Build source path (remote) and destination path (local)
         source_path = f"{self.config['source_server']}:{directory_config['source_path']}/"
         dest_path = f"{directory_config['dest_path']}/"
 
-        # Build rsync command
-        rsync_cmd = [
-            'rsync',
-            '-avz',  # archive, verbose, compress
-            '--progress',
-            '--stats',
-            '--itemize-changes',  # show detailed changes for each file
-            '--delete',  # delete files that don't exist in source
-            '-e', f"ssh -i {self.config['ssh_key_path']} -o StrictHostKeyChecking=no",
-            source_path,
-            dest_path
-        ]
+        # rsync splits the -e value itself, honouring quotes, so quote each
+        # word to keep a key path with spaces in one piece
+        ssh_cmd = ' '.join(shlex.quote(arg) for arg in ['ssh'] + self._ssh_options())
+        rsync_cmd = ['rsync'] + options + ['-e', ssh_cmd]
 
         # Add exclusions if specified
         if 'exclusions' in directory_config:
             for exclusion in directory_config['exclusions']:
                 rsync_cmd.extend(['--exclude', exclusion])
 
-        logger.info(f"Starting rsync for {directory_config['name']}: {' '.join(rsync_cmd)}")
+        rsync_cmd.extend([source_path, dest_path])
+        return rsync_cmd
+
+    def _stream_rsync(self, rsync_cmd: List[str], feed: Callable[[str], None], timeout: float) -> Tuple[int, str]:
+        """Run rsync, passing each stdout line to feed; return (returncode, stderr)"""
+        return self._stream_pipeline([rsync_cmd], feed, timeout)
+
+    def _stream_pipeline(self, commands: List[List[str]], feed: Callable[[str], None], timeout: float) -> Tuple[int, str]:
+        """Run commands piped into each other, passing each line of the last
+        command's stdout to feed; return (first non-zero returncode, stderr)"""
+        # Stream output line by line so memory stays constant regardless of
+        # how many files are listed
+        timed_out = threading.Event()
+        processes = []
+
+        with tempfile.TemporaryFile(mode='w+') as stderr_file:
+            def kill_on_timeout():
+                timed_out.set()
+                for process in processes:
+                    process.kill()
+
+            timer = threading.Timer(max(timeout, 0), kill_on_timeout)
+            try:
+                stdin = None
+                for index, command in enumerate(commands):
+                    last = index == len(commands) - 1
+                    # An absolute executable and close_fds=False let CPython
+                    # spawn via posix_spawn instead of fork+exec; Python's own
+                    # descriptors are non-inheritable (PEP 446) so none leak
+                    process = subprocess.Popen(
+                        command,
+                        executable=_which(command[0]),
+                        stdin=stdin,
+                        stdout=subprocess.PIPE,
+                        stderr=stderr_file,
+                        text=last,
+                        # Names that aren't valid UTF-8 survive as surrogates
+                        # instead of raising mid-stream
+                        errors='surrogateescape' if last else None,
+                        bufsize=1 if last else -1,
+                        close_fds=False
+                    )
+                    if stdin:
+                        # Only the next process should hold the pipe open
+                        stdin.close()
+                    processes.append(process)
+                    stdin = process.stdout
+
+                timer.start()
+                for line in processes[-1].stdout:
+                    feed(line)
+                returncodes = [process.wait() for process in processes]
+            finally:
+                timer.cancel()
+                for process in processes:
+                    if process.poll() is None:
+                        process.kill()
+                        process.wait()
+                    if process.stdout:
+                        process.stdout.close()
+
+            if timed_out.is_set():
+                raise subprocess.TimeoutExpired(commands[-1], timeout)
+
+            # Keep only the tail of stderr; a failing run can log an error
+            # per file
+            stderr_file.seek(0)
+            stderr = ''.join(collections.deque(stderr_file, maxlen=self.STDERR_TAIL_LINES))
+            return next((code for code in returncodes if code != 0), 0), stderr
+
+    def _is_local(self, directory_config: Dict) -> bool:
+        """Check if a directory can be synced without SSH"""
+        host = self.config['source_server'].rsplit('@', 1)[-1]
+        return directory_config.get('local', False) or host in ('localhost', '127.0.0.1')
+
+    def _local_sync(self, directory_config: Dict, deadline: float) -> Tuple[int, Dict, str, str]:
+        """Mirror a locally reachable directory without rsync or SSH"""
+        source_root = directory_config['source_path']
+        dest_root = directory_config['dest_path']
+        command = f"local copy {source_root} → {dest_root}"
+        excluded = _exclude_matcher(directory_config.get('exclusions', []))
+        logger.info(f"Starting local sync for {directory_config['name']}: {command}")
+
+        parser = _StreamingStatsParser()
+        totals = {'files': 0, 'size': 0, 'transferred': 0}
+        errors = []
+        # Like rsync -a: permissions and times, plus owner and group when
+        # running as root; fast mode keeps only times, like -rlt
+        preserve = directory_config.get('preserve_attributes', True)
+        chown = preserve and hasattr(os, 'geteuid') and os.geteuid() == 0
+
+        def copy_attributes(source_path: str, dest_path: str, st: os.stat_result, symlink: bool = False):
+            if chown:
+                (os.lchown if symlink else os.chown)(dest_path, st.st_uid, st.st_gid)
+            if symlink:
+                return
+            if preserve:
+                shutil.copystat(source_path, dest_path)
+            else:
+                os.utime(dest_path, ns=(st.st_atime_ns, st.st_mtime_ns))
+
+        def check_deadline():
+            # Checked between entries; a single file copy is not interrupted
+            if time.monotonic() > deadline:
+                raise subprocess.TimeoutExpired(command, self.config.get('timeout', 3600))
+
+        def remove(path: str, rel_path: str):
+            if os.path.isdir(path) and not os.path.islink(path):
+                shutil.rmtree(path)
+            else:
+                os.unlink(path)
+                parser.record('deleted', rel_path)
+
+        def sync_dir(source_dir: str, dest_dir: str, rel_dir: str):
+            check_deadline()
+            os.makedirs(dest_dir, exist_ok=True)
+            with os.scandir(source_dir) as it:
+                entries = {entry.name: entry for entry in it
+                           if not excluded(os.path.join(rel_dir, entry.name),
+                                           entry.is_dir(follow_symlinks=False))}
+
+            # Like rsync --delete: remove what the source no longer has,
+            # leaving excluded files alone
+            with os.scandir(dest_dir) as it:
+                extraneous = [entry.name for entry in it if entry.name not in entries
+                              and not excluded(os.path.join(rel_dir, entry.name),
+                                               entry.is_dir(follow_symlinks=False))]
+            for name in extraneous:
+                try:
+                    remove(os.path.join(dest_dir, name), os.path.join(rel_dir, name))
+                except OSError as e:
+                    errors.append(f"{os.path.join(rel_dir, name)}: {e}\n")
+
+            for name, entry in entries.items():
+                check_deadline()
+                rel_path = os.path.join(rel_dir, name)
+                dest_path = os.path.join(dest_dir, name)
+                try:
+                    if entry.is_symlink():
+                        target = os.readlink(entry.path)
+                        if os.path.islink(dest_path) and os.readlink(dest_path) == target:
+                            continue
+                        if os.path.lexists(dest_path):
+                            remove(dest_path, rel_path)
+                        os.symlink(target, dest_path)
+                        copy_attributes(entry.path, dest_path, entry.stat(follow_symlinks=False), symlink=True)
+                    elif entry.is_dir():
+                        # Replace a symlink rather than following it, or the
+                        # copy and deletions would land outside the backup
+                        if os.path.islink(dest_path) or (os.path.lexists(dest_path) and not os.path.isdir(dest_path)):
+                            remove(dest_path, rel_path)
+                        sync_dir(entry.path, dest_path, rel_path)
+                    elif entry.is_file():
+                        st = entry.stat()
+                        totals['files'] += 1
+                        totals['size'] += st.st_size
+                        try:
+                            dest_st = os.lstat(dest_path)
+                        except FileNotFoundError:
+                            dest_st = None
+                        if dest_st and stat.S_ISDIR(dest_st.st_mode):
+                            remove(dest_path, rel_path)
+                        # Same quick check as rsync: size and modification time
+                        # of a regular file (a symlink here is replaced)
+                        elif (dest_st and stat.S_ISREG(dest_st.st_mode) and dest_st.st_size == st.st_size
+                              and dest_st.st_mtime_ns == st.st_mtime_ns):
+                            # Content is current; still fix attributes like rsync
+                            if preserve and stat.S_IMODE(dest_st.st_mode) != stat.S_IMODE(st.st_mode):
+                                os.chmod(dest_path, stat.S_IMODE(st.st_mode))
+                            if chown and (dest_st.st_uid, dest_st.st_gid) != (st.st_uid, st.st_gid):
+                                os.chown(dest_path, st.st_uid, st.st_gid)
+                            continue
+                        tmp_path = os.path.join(dest_dir, f".{name}.bsync-tmp")
+                        _copy_file(entry.path, tmp_path)
+                        copy_attributes(entry.path, tmp_path, st)
+                        os.replace(tmp_path, dest_path)
+                        totals['transferred'] += 1
+                        parser.record('updated' if dest_st else 'added', rel_path)
+                except OSError as e:
+                    errors.append(f"{rel_path}: {e}\n")
+
+            # After filling it, so adding entries doesn't reset its mtime
+            # and a read-only mode doesn't block the copy
+            try:
+                copy_attributes(source_dir, dest_dir, os.stat(source_dir))
+            except OSError as e:
+                errors.append(f"{rel_dir or '.'}: {e}\n")
 
         try:
-            # Run rsync command
-            result = subprocess.run(
-                rsync_cmd,
-                capture_output=True,
-                text=True,
-                timeout=self.config.get('timeout', 3600)  # Default 1 hour timeout
+            sync_dir(source_root, dest_root, '')
+        except OSError as e:
+            errors.append(f"{source_root}: {e}\n")
+
+        parser.stats.update({
+            'total_files': f"{totals['files']:,}",
+            'files_transferred': f"{totals['transferred']:,}",
+            'total_size': totals['size'],
+            'bytes_sent': 0
+        })
+        # 23 is rsync's exit code for a partial transfer due to errors
+        return (23 if errors else 0), parser.result(), ''.join(errors), command
+
+    def _run_tar_stream(self, directory_config: Dict, deadline: float) -> Tuple[int, Dict, str, str]:
+        """Copy a directory as a single tar stream over SSH"""
+        # Only an explicit zstd choice adds zstd to the pipeline, since it
+        # must be installed on both hosts
+        compress = self._compression(directory_config) == 'zstd'
+
+        remote_cmd = ['tar', 'cf', '-', '-C', directory_config['source_path']]
+        for exclusion in directory_config.get('exclusions', []):
+            remote_cmd.append(f"--exclude={exclusion}")
+        remote_cmd.append('.')
+        remote_cmd = ' '.join(shlex.quote(arg) for arg in remote_cmd)
+        if compress:
+            remote_cmd += ' | zstd -c -3'
+
+        commands = [['ssh'] + self._ssh_options() + [self.config['source_server'], remote_cmd]]
+        if compress:
+            commands.append(['zstd', '-dc'])
+        commands.append(['tar', 'xvf', '-', '-C', directory_config['dest_path']])
+        command = ' | '.join(' '.join(cmd) for cmd in commands)
+        logger.info(f"Starting tar stream for {directory_config['name']}: {command}")
+
+        # Every extracted regular file is new to the destination
+        parser = _StreamingStatsParser()
+
+        def collect(line: str):
+            path = line.rstrip('\n')
+            if path.startswith('./'):
+                path = path[2:]
+            if path and not path.endswith('/'):
+                parser.record('added', path)
+
+        os.makedirs(directory_config['dest_path'], exist_ok=True)
+        returncode, stderr = self._stream_pipeline(commands, collect, deadline - time.monotonic())
+
+        added_count = parser.counts['added']
+        parser.stats['total_files'] = f"{added_count:,}"
+        parser.stats['files_transferred'] = f"{added_count:,}"
+        return returncode, parser.result(), stderr, command
+
+    # rsync's escape for bytes it won't print in --out-format output; a
+    # literal "\#" followed by digits is itself escaped, so this is unambiguous
+    _NAME_ESCAPE_RE = re.compile(rb'\\#([0-7]{3})')
+
+    @staticmethod
+    def _unescape_name(name: str) -> str:
+        """Turn a name printed by rsync back into the real file name"""
+        if '\\#' not in name:
+            return name
+        raw = BackupSyncer._NAME_ESCAPE_RE.sub(lambda m: bytes([int(m.group(1), 8)]), os.fsencode(name))
+        return os.fsdecode(raw)
+
+    def _plan_chunks(self, file_list: List[Tuple[int, str]], n: int, chunk_dir: str) -> List[str]:
+        """Split (size, path) entries into n byte-balanced --files-from lists"""
+        # Greedy bin packing: largest files first, each into the lightest chunk
+        chunks = [[] for _ in range(n)]
+        heap = [(0, index) for index in range(n)]
+        for size, path in sorted(file_list, reverse=True):
+            total, index = heapq.heappop(heap)
+            chunks[index].append(path)
+            heapq.heappush(heap, (total + size, index))
+
+        chunk_paths = []
+        for index, paths in enumerate(chunks):
+            if not paths:
+                continue
+            chunk_path = os.path.join(chunk_dir, f"chunk{index}")
+            # Written as the original bytes and NUL-separated for --from0:
+            # once rsync's escapes are decoded a name may contain newlines
+            # or bytes that aren't valid UTF-8
+            with open(chunk_path, 'wb') as f:
+                f.writelines(os.fsencode(path) + b'\0' for path in paths)
+            chunk_paths.append(chunk_path)
+        return chunk_paths
+
+    def _run_parallel_rsync(self, directory_config: Dict, streams: int, deadline: float) -> Tuple[int, Dict, str, str]:
+        """Sync a directory with several concurrent rsyncs over split file lists"""
+        name = directory_config['name']
+
+        # Enumerate the files that need transferring with a dry run
+        file_list = []
+
+        def collect(line: str):
+            size, _, path = line.rstrip('\n').partition(' ')
+            if path and not path.endswith('/') and size.isdigit():
+                file_list.append((int(size), self._unescape_name(path)))
+
+        # -8 keeps non-ASCII names as-is even under cron's C locale; control
+        # characters are still escaped as \#ooo and decoded in collect()
+        list_cmd = self._rsync_cmd(directory_config, [*self._archive_flags(directory_config), '-8',
+                                                      '--dry-run', '--out-format=%l %n'])
+        list_command = ' '.join(list_cmd)
+        logger.info(f"Listing changed files for {name}: {list_command}")
+        returncode, stderr = self._stream_rsync(list_cmd, collect, deadline - time.monotonic())
+        if returncode != 0:
+            return returncode, _StreamingStatsParser().result(), stderr, list_command
+
+        shard_stats = []
+        stderrs = []
+        with tempfile.TemporaryDirectory(prefix='bsync-') as chunk_dir:
+            chunk_paths = self._plan_chunks(file_list, streams, chunk_dir)
+            logger.info(f"Transferring {len(file_list)} files for {name} in {len(chunk_paths)} parallel streams")
+
+            def run_chunk(chunk_path: str) -> Tuple[int, Dict, str, str]:
+                parser = _StreamingStatsParser()
+                options = self._transfer_options(directory_config, delete=False) + ['--files-from', chunk_path, '--from0']
+                chunk_cmd = self._rsync_cmd(directory_config, options)
+                returncode, stderr = self._stream_rsync(chunk_cmd, parser.feed, deadline - time.monotonic())
+                return returncode, parser.result(), stderr, ' '.join(chunk_cmd)
+
+            if chunk_paths:
+                with ThreadPoolExecutor(max_workers=len(chunk_paths)) as executor:
+                    for returncode, stats, stderr, chunk_command in executor.map(run_chunk, chunk_paths):
+                        shard_stats.append(stats)
+                        if stderr:
+                            stderrs.append(stderr)
+                        if returncode != 0:
+                            return returncode, _merge_stats(shard_stats), ''.join(stderrs), chunk_command
+
+        # A final regular pass applies deletions and directory attributes and
+        # reports totals for the whole tree; file data is already in place
+        parser = _StreamingStatsParser()
+        rsync_cmd = self._rsync_cmd(directory_config, self._transfer_options(directory_config))
+        command = ' '.join(rsync_cmd)
+        logger.info(f"Finalizing rsync for {name}: {command}")
+        returncode, stderr = self._stream_rsync(rsync_cmd, parser.feed, deadline - time.monotonic())
+        if stderr:
+            stderrs.append(stderr)
+
+        return returncode, _merge_stats(shard_stats, parser.result()), ''.join(stderrs), command
+
+    def _run_single_rsync(self, directory_config: Dict, deadline: float, extra_options: Optional[List[str]] = None, delete: bool = True) -> Tuple[int, Dict, str, str]:
+        """Sync a directory with one rsync process"""
+        options = self._transfer_options(directory_config, delete=delete) + (extra_options or [])
+        rsync_cmd = self._rsync_cmd(directory_config, options)
+        command = ' '.join(rsync_cmd)
+        logger.info(f"Starting rsync for {directory_config['name']}: {command}")
+
+        parser = _StreamingStatsParser()
+        returncode, stderr = self._stream_rsync(rsync_cmd, parser.feed, deadline - time.monotonic())
+        return returncode, parser.result(), stderr, command
+
+    def _run_full_rsync(self, directory_config: Dict, deadline: float) -> Tuple[int, Dict, str, str]:
+        """Sync a whole directory tree, split into parallel streams if configured"""
+        streams = directory_config.get('parallel_streams', 1)
+        if streams > 1:
+            return self._run_parallel_rsync(directory_config, streams, deadline)
+        return self._run_single_rsync(directory_config, deadline)
+
+    def _state_path(self, directory_config: Dict) -> str:
+        """Return the file recording sync state for a directory"""
+        state_dir = os.path.expanduser(self.config.get('state_dir', '~/.cache/bsync'))
+        # Keyed on what is synced, so distinct directories never share state
+        # and a changed source or destination starts from a full sync; the
+        # name is only a readable label
+        key = json.dumps([self.config['source_server'], directory_config['source_path'],
+                          directory_config['dest_path']])
+        digest = hashlib.sha256(key.encode()).hexdigest()[:16]
+        label = re.sub(r'[^A-Za-z0-9._-]', '_', directory_config['name'])
+        return os.path.join(state_dir, f"{label}-{digest}.state")
+
+    def _load_state(self, directory_config: Dict) -> Dict:
+        """Return the saved sync state of a directory, empty if there is none"""
+        try:
+            with open(self._state_path(directory_config), 'rb') as f:
+                return _json_loads()(f.read())
+        except (OSError, ValueError):
+            return {}
+
+    def _save_state(self, directory_config: Dict, state: Dict):
+        """Atomically replace the saved sync state of a directory"""
+        path = self._state_path(directory_config)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(state, f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Failed to save sync state for {directory_config['name']}: {e}")
+
+    def _run_remote(self, remote_cmd: str, timeout: float) -> subprocess.CompletedProcess:
+        """Run a shell command on the source server and capture its output"""
+        return subprocess.run(
+            ['ssh'] + self._ssh_options() + [self.config['source_server'], remote_cmd],
+            stdin=subprocess.DEVNULL,
+            capture_output=True,
+            timeout=max(timeout, 0)
+        )
+
+    def _run_incremental_rsync(self, directory_config: Dict, deadline: float) -> Tuple[int, Dict, str, str]:
+        """Transfer only files changed on the source since the last successful sync"""
+        name = directory_config['name']
+        state = self._load_state(directory_config)
+
+        # Take the reference time from the source's clock so clock skew
+        # between the servers cannot hide changes
+        result = self._run_remote('date +%s', deadline - time.monotonic())
+        if result.returncode != 0:
+            return result.returncode, _StreamingStatsParser().result(), result.stderr.decode(errors='replace'), 'date +%s'
+        sync_started = int(result.stdout.strip())
+
+        # Deletions are only seen by a full pass, so force one periodically
+        changed = None
+        full_interval = self.config.get('full_sync_interval', 7 * 24 * 3600)
+        if 'last_sync' in state and sync_started - state.get('last_full_sync', 0) < full_interval:
+            # ctime rather than mtime also catches files moved in with old
+            # mtimes. A moved directory gets a new ctime but its contents
+            # don't, so directories are listed too and rsync recurses into them
+            find_cmd = (f"cd {shlex.quote(directory_config['source_path'])} && "
+                        f"find . \\( -type f -o -type l -o -type d \\) -newerct @{state['last_sync']} -print0")
+            result = self._run_remote(find_cmd, deadline - time.monotonic())
+            if result.returncode == 0:
+                changed = result.stdout
+                # The top directory changes whenever an entry is added or
+                # removed directly in it; recursing from there is a full sync
+                if b'.' in changed.split(b'\0'):
+                    logger.info(f"Top of {name} changed since last sync")
+                    changed = None
+            else:
+                logger.warning(f"Listing changed files for {name} failed, running full sync: "
+                               f"{result.stderr.decode(errors='replace').strip()[-200:]}")
+
+        if changed is None:
+            logger.info(f"Running full sync for {name}")
+            returncode, stats, stderr, command = self._run_full_rsync(directory_config, deadline)
+            if returncode == 0:
+                self._save_state(directory_config, {'last_sync': sync_started, 'last_full_sync': sync_started})
+            return returncode, stats, stderr, command
+
+        if not changed:
+            logger.info(f"No changes for {name} since last sync")
+            self._save_state(directory_config, dict(state, last_sync=sync_started))
+            return 0, _StreamingStatsParser().result(), '', find_cmd
+
+        with tempfile.NamedTemporaryFile(prefix='bsync-', suffix='.list') as files_from:
+            files_from.write(changed)
+            files_from.flush()
+            returncode, stats, stderr, command = self._run_single_rsync(
+                directory_config, deadline, ['--files-from', files_from.name, '--from0', '-r'], delete=False
             )
+        if returncode == 0:
+            self._save_state(directory_config, dict(state, last_sync=sync_started))
+        return returncode, stats, stderr, command
+
+    def _run_rsync_if_changed(self, directory_config: Dict, deadline: float) -> Tuple[int, Dict, str, str]:
+        """Run a full sync unless nothing on the source changed since the last one"""
+        name = directory_config['name']
+        state = self._load_state(directory_config)
+
+        # One round trip for the source's clock and a probe that stops at
+        # the first entry changed since the last sync; directories are
+        # included so deletions and renames count as changes
+        probe_cmd = 'date +%s'
+        if 'last_sync' in state:
+            probe_cmd += (f" && find {shlex.quote(directory_config['source_path'])} "
+                          f"-newerct @{state['last_sync']} -print -quit")
+        result = self._run_remote(probe_cmd, min(deadline - time.monotonic(), 60))
+        lines = result.stdout.splitlines()
+        if result.returncode != 0 or not lines:
+            logger.warning(f"Change probe for {name} failed, running rsync: "
+                           f"{result.stderr.decode(errors='replace').strip()[-200:]}")
+            return self._run_full_rsync(directory_config, deadline)
+        sync_started = int(lines[0])
+
+        if 'last_sync' in state and len(lines) == 1:
+            logger.info(f"No changes for {name} since last sync, skipping rsync")
+            return 0, _StreamingStatsParser().result(), '', probe_cmd
+
+        returncode, stats, stderr, command = self._run_full_rsync(directory_config, deadline)
+        if returncode == 0:
+            self._save_state(directory_config, dict(state, last_sync=sync_started))
+        return returncode, stats, stderr, command
+
+    def run_rsync(self, directory_config: Dict) -> Dict:
+        """Execute rsync command for a specific directory and return results"""
+        start_time = datetime.now()
+        # Durations come from the monotonic clock so NTP steps can't skew them
+        started = time.monotonic()
+
+        timeout = self.config.get('timeout', 3600)  # Default 1 hour timeout
+        deadline = started + timeout
+
+        try:
+            returncode = None
+            if self._is_local(directory_config):
+                returncode, stats, stderr, command = self._local_sync(directory_config, deadline)
+            elif directory_config.get('mode', 'rsync') == 'tar-stream':
+                try:
+                    returncode, stats, stderr, command = self._run_tar_stream(directory_config, deadline)
+                except OSError as e:
+                    # e.g. zstd or tar missing locally
+                    returncode, stderr = None, str(e)
+                if returncode != 0:
+                    # rsync picks up whatever the partial extraction left behind
+                    logger.warning(f"Tar stream failed for {directory_config['name']}, falling back to rsync: {stderr.strip()[-200:]}")
+                    returncode = None
+
+            if returncode is None:
+                if directory_config.get('incremental', False):
+                    returncode, stats, stderr, command = self._run_incremental_rsync(directory_config, deadline)
+                elif directory_config.get('skip_if_unchanged', False):
+                    returncode, stats, stderr, command = self._run_rsync_if_changed(directory_config, deadline)
+                else:
+                    returncode, stats, stderr, command = self._run_full_rsync(directory_config, deadline)
 
             end_time = datetime.now()
-            duration = end_time - start_time
+            duration = timedelta(seconds=time.monotonic() - started)
 
             return {
-                'success': result.returncode == 0,
-                'returncode': result.returncode,
-                'stdout': result.stdout,
-                'stderr': result.stderr,
+                'success': returncode == 0,
+                'returncode': returncode,
+                'stats': stats,
+                'stderr': stderr,
                 'start_time': start_time,
                 'end_time': end_time,
                 'duration': duration,
-                'command': ' '.join(rsync_cmd),
+                'command': command,
                 'directory_name': directory_config['name'],
                 'source_path': directory_config['source_path'],
                 'dest_path': directory_config['dest_path']
@@ -189,7 +1182,7 @@ class BackupSyncer:
                 'error': 'Timeout',
                 'start_time': start_time,
                 'end_time': datetime.now(),
-                'duration': datetime.now() - start_time,
+                'duration': timedelta(seconds=time.monotonic() - started),
                 'directory_name': directory_config['name'],
                 'source_path': directory_config['source_path'],
                 'dest_path': directory_config['dest_path']
@@ -201,208 +1194,202 @@ class BackupSyncer:
                 'error': str(e),
                 'start_time': start_time,
                 'end_time': datetime.now(),
-                'duration': datetime.now() - start_time,
+                'duration': timedelta(seconds=time.monotonic() - started),
                 'directory_name': directory_config['name'],
                 'source_path': directory_config['source_path'],
                 'dest_path': directory_config['dest_path']
             }
 
-    def parse_rsync_stats(self, stdout: str) -> Dict:
-        """Parse rsync statistics and file changes from output"""
-        stats = {}
-        lines = stdout.split('\n')
-
-        # Lists to track file operations
-        added_files = []
-        deleted_files = []
-        updated_files = []
-
-                # Parse each line
-        for line in lines:
-            line_stripped = line.strip()
-            
-            # Skip empty lines and progress output
-            if not line_stripped or any(pattern in line_stripped for pattern in [
-                'kB/s', 'MB/s', 'GB/s', '%', 'xfr#', 'ir-chk', 'to-chk', 'speedup is'
-            ]):
-                continue
-            
-            # Parse statistics
-            if 'Number of files:' in line_stripped:
-                stats['total_files'] = line_stripped.split(':')[1].strip()
-            elif 'Number of regular files transferred:' in line_stripped:
-                stats['files_transferred'] = line_stripped.split(':')[1].strip()
-            elif 'Total file size:' in line_stripped:
-                size_str = line_stripped.split(':')[1].strip().split()[0]
-                try:
-                    stats['total_size'] = int(size_str.replace(',', ''))
-                except:
-                    stats['total_size'] = 0
-            elif 'Total bytes sent:' in line_stripped:
-                size_str = line_stripped.split(':')[1].strip().split()[0]
-                try:
-                    stats['bytes_sent'] = int(size_str.replace(',', ''))
-                except:
-                    stats['bytes_sent'] = 0
-            
-            # Parse file operations (from --itemize-changes output)
-            elif line_stripped.startswith('deleting ') or line_stripped.startswith('*deleting'):
-                # File being deleted
-                if line_stripped.startswith('*deleting'):
-                    deleted_file = line_stripped[10:].strip()  # Remove "*deleting " prefix
-                else:
-                    deleted_file = line_stripped[9:].strip()   # Remove "deleting " prefix
-                if deleted_file and not deleted_file.endswith('/') and self._is_valid_filename(deleted_file):
-                    deleted_files.append(deleted_file)
-            elif len(line) > 11 and line[0] in ['>', '<', '*', '.']:
-                # Parse --itemize-changes output format: YXcstpoguax filename
-                item_type = line[1:2]  # f=file, d=directory, L=symlink, etc.
-                changes = line[2:11]   # 9 character change summary
-                filename = line[11:].strip()
-                
-                if item_type == 'f' and filename and self._is_valid_filename(filename):
-                    if '+++++++' in changes:
-                        # New file (++++++++ means new)
-                        added_files.append(filename)
-                    elif '.' in changes and changes != '.........':
-                        # Updated file (. means unchanged, other chars mean changes)
-                        updated_files.append(filename)
-
-        # Add file operation counts and lists to stats
-        stats['added_files'] = added_files[:10]  # Limit to first 10 for notifications
-        stats['deleted_files'] = deleted_files[:10]
-        stats['updated_files'] = updated_files[:10]
-        stats['added_count'] = len(added_files)
-        stats['deleted_count'] = len(deleted_files)
-        stats['updated_count'] = len(updated_files)
-
-        return stats
-
-    def send_notification(self, results: list):
-        """Send Telegram notification based on sync results"""
+    def send_notification(self, results: list, total_duration: Optional[timedelta] = None,
+                          message_id: Optional[int] = None):
+        """Send Telegram notification based on sync results, replacing message_id if all succeeded"""
         timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
-        successful_syncs = [r for r in results if r['success']]
-        failed_syncs = [r for r in results if not r['success']]
+        successful_syncs = []
+        failed_syncs = []
+        for r in results:
+            (successful_syncs if r['success'] else failed_syncs).append(r)
 
-        total_duration = sum([r['duration'] for r in results], timedelta())
+        if total_duration is None:
+            # Wall-clock span of the results, since directories run concurrently
+            total_duration = max(r['end_time'] for r in results) - min(r['start_time'] for r in results)
+        # Formatted once for whichever header is sent
+        total_duration = str(total_duration).split('.')[0]
+        source_server = self.config['source_server']
 
         if len(failed_syncs) == 0:
             # All syncs successful
-            message = f"""
+            self.telegram.queue(f"""
 🟢 <b>Backup Sync Successful</b>
 
 📅 <b>Time:</b> {timestamp}
-⏱️ <b>Total Duration:</b> {str(total_duration).split('.')[0]}
+⏱️ <b>Total Duration:</b> {total_duration}
 📁 <b>Directories:</b> {len(results)}
 
-"""
+""")
 
             for result in successful_syncs:
-                stats = self.parse_rsync_stats(result.get('stdout', ''))
+                stats = result['stats']
 
                 # Build file changes summary
-                changes_summary = ""
-                if stats.get('added_count', 0) > 0:
-                    changes_summary += f"   ➕ Added: {stats['added_count']} files\n"
-                    if stats.get('added_files'):
-                        sample_files = stats['added_files'][:3]  # Show first 3
-                        for file in sample_files:
-                            changes_summary += f"      • {file}\n"
-                        if stats['added_count'] > 3:
-                            changes_summary += f"      ... and {stats['added_count'] - 3} more\n"
-
-                if stats.get('updated_count', 0) > 0:
-                    changes_summary += f"   🔄 Updated: {stats['updated_count']} files\n"
-                    if stats.get('updated_files'):
-                        sample_files = stats['updated_files'][:3]  # Show first 3
-                        for file in sample_files:
-                            changes_summary += f"      • {file}\n"
-                        if stats['updated_count'] > 3:
-                            changes_summary += f"      ... and {stats['updated_count'] - 3} more\n"
-
-                if stats.get('deleted_count', 0) > 0:
-                    changes_summary += f"   🗑️ Deleted: {stats['deleted_count']} files\n"
-                    if stats.get('deleted_files'):
-                        sample_files = stats['deleted_files'][:3]  # Show first 3
+                changes_summary = []
+                for label, emoji, operation in (('Added', '➕', 'added'),
+                                                ('Updated', '🔄', 'updated'),
+                                                ('Deleted', '🗑️', 'deleted')):
+                    count = stats.get(f'{operation}_count', 0)
+                    if count > 0:
+                        changes_summary.append(f"   {emoji} {label}: {count} files\n")
+                        sample_files = stats.get(f'{operation}_files', [])[:3]  # Show first 3
                         for file in sample_files:
-                            changes_summary += f"      • {file}\n"
-                        if stats['deleted_count'] > 3:
-                            changes_summary += f"      ... and {stats['deleted_count'] - 3} more\n"
+                            changes_summary.append(f"      • {file}\n")
+                        if sample_files and count > 3:
+                            changes_summary.append(f"      ... and {count - 3} more\n")
 
-                if not changes_summary:
-                    changes_summary = "   ✅ No changes (files up to date)\n"
+                changes_summary = ''.join(changes_summary) or "   ✅ No changes (files up to date)\n"
 
-                message += f"""
+                self.telegram.queue(f"""
 📂 <b>{result['directory_name']}</b>
    ⏱️ Duration: {str(result['duration']).split('.')[0]}
    🗂️ Files: {stats.get('total_files', 'N/A')}
    📊 Transferred: {stats.get('files_transferred', 'N/A')} files
    💾 Size: {self.format_size(stats.get('total_size', 0))}
    📤 Sent: {self.format_size(stats.get('bytes_sent', 0))}
-{changes_summary}"""
+{changes_summary}""")
 
         elif len(successful_syncs) == 0:
             # All syncs failed
-            message = f"""
+            self.telegram.queue(f"""
 🔴 <b>Backup Sync Failed</b>
 
 📅 <b>Time:</b> {timestamp}
-⏱️ <b>Total Duration:</b> {str(total_duration).split('.')[0]}
+⏱️ <b>Total Duration:</b> {total_duration}
 📁 <b>Failed Directories:</b> {len(failed_syncs)}
 
-"""
+""")
 
             for result in failed_syncs[:3]:  # Show first 3 failures
                 error_msg = result.get('stderr', result.get('error', 'Unknown error'))
-                message += f"""
+                self.telegram.queue(f"""
 📂 <b>{result['directory_name']}</b>
    ❌ Error: {error_msg[:200]}
-   📍 {self.config['source_server']}:{result['source_path']} → local:{result['dest_path']}
-"""
+   📍 {source_server}:{result['source_path']} → local:{result['dest_path']}
+""")
 
             if len(failed_syncs) > 3:
-                message += f"\n... and {len(failed_syncs) - 3} more failures"
+                self.telegram.queue(f"\n... and {len(failed_syncs) - 3} more failures")
 
-            message += "\nPlease check the logs for more details."
+            self.telegram.queue("\nPlease check the logs for more details.")
 
         else:
             # Mixed results
-            message = f"""
+            self.telegram.queue(f"""
 🟡 <b>Backup Sync Partial Success</b>
 
 📅 <b>Time:</b> {timestamp}
-⏱️ <b>Total Duration:</b> {str(total_duration).split('.')[0]}
+⏱️ <b>Total Duration:</b> {total_duration}
 ✅ <b>Successful:</b> {len(successful_syncs)}
 ❌ <b>Failed:</b> {len(failed_syncs)}
 
 <b>Successful:</b>
-"""
+""")
 
             for result in successful_syncs:
-                stats = self.parse_rsync_stats(result.get('stdout', ''))
-                changes_info = ""
+                stats = result['stats']
+                changes_info = []
                 if stats.get('added_count', 0) > 0:
-                    changes_info += f"+{stats['added_count']} "
+                    changes_info.append(f"+{stats['added_count']}")
                 if stats.get('updated_count', 0) > 0:
-                    changes_info += f"~{stats['updated_count']} "
+                    changes_info.append(f"~{stats['updated_count']}")
                 if stats.get('deleted_count', 0) > 0:
-                    changes_info += f"-{stats['deleted_count']} "
-                changes_info = changes_info.strip() or "no changes"
-                message += f"📂 {result['directory_name']} ({changes_info})\n"
+                    changes_info.append(f"-{stats['deleted_count']}")
+                changes_info = ' '.join(changes_info) or "no changes"
+                self.telegram.queue(f"📂 {result['directory_name']} ({changes_info})\n")
 
-            message += "\n<b>Failed:</b>\n"
+            self.telegram.queue("\n<b>Failed:</b>\n")
             for result in failed_syncs:
-                message += f"📂 {result['directory_name']}\n"
+                self.telegram.queue(f"📂 {result['directory_name']}\n")
+
+            self.telegram.queue("\nPlease check the logs for error details.")
+
+        # Edits don't trigger a push notification, so only a clean run is
+        # folded into the start message; any failure is sent fresh to alert
+        self.telegram.flush(None if failed_syncs else message_id)
+
+    def _probe_directory(self, directory_config: Dict) -> Optional[str]:
+        """Check local paths of a directory; return a problem description or None"""
+        name = directory_config['name']
+        if self._is_local(directory_config) and not os.access(directory_config['source_path'], os.R_OK):
+            return f"{name}: source {directory_config['source_path']} is not readable"
+
+        # rsync and tar create the destination, so its nearest existing
+        # ancestor has to be writable
+        dest = os.path.abspath(directory_config['dest_path'])
+        while not os.path.exists(dest):
+            dest = os.path.dirname(dest)
+        if not os.access(dest, os.W_OK):
+            return f"{name}: destination {dest} is not writable"
+        return None
+
+    def _probe_source(self, directories: List[Dict]) -> List[str]:
+        """Check that the source server is reachable and has every source path"""
+        # One SSH session checks all paths and prints the missing ones
+        paths = ' '.join(shlex.quote(d['source_path']) for d in directories)
+        remote_cmd = f'for p in {paths}; do [ -d "$p" ] || echo "$p"; done'
+        try:
+            result = subprocess.run(
+                ['ssh', '-o', 'BatchMode=yes', '-o', 'ConnectTimeout=10'] + self._ssh_options()
+                + [self.config['source_server'], remote_cmd],
+                stdin=subprocess.DEVNULL,
+                capture_output=True,
+                text=True,
+                timeout=60
+            )
+        except Exception as e:
+            return [f"cannot reach {self.config['source_server']}: {e}"]
+
+        if result.returncode != 0:
+            error = result.stderr.strip() or f"ssh exited with code {result.returncode}"
+            return [f"cannot reach {self.config['source_server']}: {error[:200]}"]
 
-            message += "\nPlease check the logs for error details."
+        missing = set(result.stdout.splitlines())
+        return [f"{d['name']}: source {d['source_path']} does not exist"
+                for d in directories if d['source_path'] in missing]
 
-        self.telegram.send_message(message)
+    def _preflight(self) -> List[str]:
+        """Validate source reachability and destinations before syncing"""
+        directories = self.config['directories']
+        remote = [d for d in directories if not self._is_local(d)]
+
+        with ThreadPoolExecutor() as executor:
+            remote_future = executor.submit(self._probe_source, remote) if remote else None
+            problems = [problem for problem in executor.map(self._probe_directory, directories) if problem]
+            if remote_future:
+                problems.extend(remote_future.result())
+        return problems
 
     def sync(self):
         """Main sync function"""
         logger.info("Starting backup synchronization")
 
+        # Fail in seconds on an unreachable server or bad path instead of
+        # after hours of syncing the other directories
+        problems = self._preflight()
+        if problems:
+            for problem in problems:
+                logger.error(f"Preflight check failed: {problem}")
+            problems_list = "\n".join(f"❌ {problem}" for problem in problems)
+            self.telegram.send_message(f"""
+🔴 <b>Backup Sync Aborted</b>
+
+📅 <b>Time:</b> {datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
+
+<b>Preflight checks failed:</b>
+{problems_list}
+
+No directories were synced.
+""")
+            return False
+
         # Send start notification
         directories_list = "\n".join([f"📂 {d['name']}: {d['source_path']} → {d['dest_path']}"
                                      for d in self.config['directories']])
@@ -417,22 +1404,41 @@ class BackupSyncer:
 
 <b>Source Server:</b> {self.config['source_server']}
 """
-        self.telegram.send_message(start_message)
-
-        # Run rsync for each directory
-        results = []
-        overall_success = True
+        start_sent = self._notifications.submit(self.telegram.send_message, start_message)
 
-        for directory in self.config['directories']:
-            logger.info(f"Starting sync for directory: {directory['name']}")
-            result = self.run_rsync(directory)
-            results.append(result)
-
-            if result['success']:
-                logger.info(f"Successfully synced directory: {directory['name']}")
-            else:
-                logger.error(f"Failed to sync directory {directory['name']}: {result.get('stderr', result.get('error'))}")
-                overall_success = False
+        self._open_ssh_master()
+        try:
+            # Run rsync for all directories concurrently; each rsync is an
+            # independent process so threads only wait on the subprocess
+            directories = self.config['directories']
+            max_parallel = self.config.get('max_parallel', min(8, len(directories)))
+            results = [None] * len(directories)
+            overall_success = True
+            # Directories overlap, so the total is the elapsed time of the
+            # whole batch, not the sum of their durations
+            started = time.monotonic()
+
+            with ThreadPoolExecutor(max_workers=max_parallel) as executor:
+                futures = {}
+                for index, directory in enumerate(directories):
+                    logger.info(f"Starting sync for directory: {directory['name']}")
+                    futures[executor.submit(self.run_rsync, directory)] = index
+
+                for future in as_completed(futures):
+                    index = futures[future]
+                    directory = directories[index]
+                    result = future.result()
+                    # Keep results in configuration order for notifications
+                    results[index] = result
+
+                    if result['success']:
+                        logger.info(f"Successfully synced directory: {directory['name']}")
+                    else:
+                        logger.error(f"Failed to sync directory {directory['name']}: {result.get('stderr', result.get('error'))}")
+                        overall_success = False
+            total_duration = timedelta(seconds=time.monotonic() - started)
+        finally:
+            self._close_ssh_master()
 
         # Log overall result
         if overall_success:
@@ -441,19 +1447,34 @@ class BackupSyncer:
             failed_dirs = [r['directory_name'] for r in results if not r['success']]
             logger.error(f"Backup synchronization failed for directories: {', '.join(failed_dirs)}")
 
-        # Send completion notification
-        self.send_notification(results)
+        # A clean run turns the start message into the summary; the single
+        # worker has already sent it by the time this runs
+        summary_sent = self._notifications.submit(
+            lambda: self.send_notification(results, total_duration, start_sent.result())
+        )
+        # Wait for the queue to drain; result() re-raises a failure in
+        # send_notification so it reaches main() instead of vanishing
+        self._notifications.shutdown(wait=True)
+        summary_sent.result()
 
         return overall_success
 
+    def close(self):
+        """Wait for notifications still in flight, then release the Telegram session"""
+        self._notifications.shutdown(wait=True)
+        self.telegram.close()
+
 def main():
     """Main function"""
+    import argparse
+
     parser = argparse.ArgumentParser(description='Backup Synchronization Script')
     parser.add_argument('--config', default='config.json', help='Configuration file path')
     parser.add_argument('--test-telegram', action='store_true', help='Test Telegram notification')
 
     args = parser.parse_args()
 
+    syncer = None
     try:
         syncer = BackupSyncer(args.config)
 
@@ -467,7 +1488,7 @@ def main():
 This is a test message from the backup sync script.
 If you can see this, Telegram notifications are working correctly! ✅
 """
-            success = syncer.telegram.send_message(test_message)
+            success = syncer.telegram.send_message(test_message) is not None
             if success:
                 print("✅ Telegram test notification sent successfully!")
             else:
@@ -484,6 +1505,9 @@ If you can see this, Telegram notifications are working correctly! ✅
     except Exception as e:
         logger.error(f"Unexpected error: {e}")
         sys.exit(1)
+    finally:
+        if syncer:
+            syncer.close()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file